@@ -6,21 +6,27 @@
 #define COMPACT_TREE_H
 
 // include statements
+#include <cerrno>        // errno, EINTR
 #include <cstdint>       // std::uint32_t, std::uint64_t
 #include <cstdlib>       // std::atof
-#include <cstring>       // strcmp()
-#include <fcntl.h>       // O_RDONLY, open(), posix_fadvise()
+#include <cstring>       // strcmp(), std::memchr(), std::memcpy()
+#include <fcntl.h>       // O_RDONLY, open()
 #include <iostream>      // std::cerr, std::cout, std::endl
 #include <queue>         // std::queue
 #include <sstream>       // std::stringstream
 #include <stack>         // std::stack
-#include <stdexcept>     // std::invalid_argument
+#include <stdexcept>     // std::invalid_argument, std::out_of_range
 #include <string>        // std::string
-#include <unistd.h>      // read()
+#include <sys/mman.h>    // madvise(), mmap(), munmap()
+#include <sys/stat.h>    // fstat()
+#include <unistd.h>      // close(), read()
 #include <unordered_map> // std::unordered_map
 #include <unordered_set> // std::unordered_set
 #include <utility>       // std::pair
 #include <vector>        // std::vector
+#if defined __AVX2__
+#include <immintrin.h>   // _mm256_cmpeq_epi8(), _mm256_movemask_epi8(), etc.
+#endif
 
 // define node type, which is a fixed-width unsigned integer (default is 32-bit)
 #if defined CT_NODE_64
@@ -49,6 +55,7 @@ const CT_NODE_T NULL_NODE = (CT_NODE_T)(-1);
 const std::string ERROR_OPENING_FILE = "Error opening file";
 const std::string ERROR_INVALID_NEWICK_FILE = "Invalid Newick file";
 const std::string ERROR_INVALID_NEWICK_STRING = "Invalid Newick string";
+const std::string ERROR_CHILD_INDEX_OUT_OF_RANGE = "Child index out of range";
 
 // compact_tree class
 class compact_tree {
@@ -56,10 +63,11 @@ class compact_tree {
         /**
          * compact_tree important member variables
          */
-        std::vector<CT_NODE_T> parent;                // `parent[i]` is the parent of node `i`
-        std::vector<std::vector<CT_NODE_T>> children; // `children[i]` is a `vector` containing the children of node `i`
-        std::vector<std::string> label;               // `label[i]` is the label of node `i`
-        std::vector<CT_LENGTH_T> length;              // `length[i]` is the length of the edge incident to (i.e., going into) node `i`
+        std::vector<CT_NODE_T> parent;         // `parent[i]` is the parent of node `i`
+        std::vector<CT_NODE_T> children;       // children of all nodes packed contiguously (CSR): the children of node `i` are `children[children_start[i]]` to `children[children_start[i+1]-1]`
+        std::vector<CT_NODE_T> children_start; // `children_start[i]` is the index in `children` of the first child of node `i` (size is number of nodes + 1)
+        std::vector<std::string> label;        // `label[i]` is the label of node `i`
+        std::vector<CT_LENGTH_T> length;       // `length[i]` is the length of the edge incident to (i.e., going into) node `i`
 
         /**
          * compact_tree helper member variables
@@ -79,10 +87,40 @@ class compact_tree {
          */
         CT_NODE_T create_child(const CT_NODE_T parent_node);
 
+        /**
+         * Helper function to build `children` and `children_start` from `parent` in O(n) (call once all nodes have been created)
+         */
+        void build_children();
+
+        /**
+         * Helper function to find the first occurrence of any of 4 delimiter characters in a buffer (32 bytes at a time if AVX2 is available)
+         * @param buf The buffer to search
+         * @param i The index at which to start searching
+         * @param n The length of the buffer
+         * @param d0 The first delimiter
+         * @param d1 The second delimiter
+         * @param d2 The third delimiter
+         * @param d3 The fourth delimiter
+         * @return The index of the first delimiter at or after `i`, or `n` if there is none
+         */
+        static size_t find_delim(const char* buf, size_t i, size_t n, char d0, char d1, char d2, char d3) {
+#if defined __AVX2__
+            const __m256i v0 = _mm256_set1_epi8(d0); const __m256i v1 = _mm256_set1_epi8(d1); const __m256i v2 = _mm256_set1_epi8(d2); const __m256i v3 = _mm256_set1_epi8(d3);
+            for(; i + 32 <= n; i += 32) {
+                __m256i x = _mm256_loadu_si256((const __m256i*)(buf + i));
+                __m256i m = _mm256_or_si256(_mm256_or_si256(_mm256_cmpeq_epi8(x, v0), _mm256_cmpeq_epi8(x, v1)), _mm256_or_si256(_mm256_cmpeq_epi8(x, v2), _mm256_cmpeq_epi8(x, v3)));
+                unsigned int mask = (unsigned int)_mm256_movemask_epi8(m);
+                if(mask != 0) { return i + __builtin_ctz(mask); }
+            }
+#endif
+            for(; i < n; ++i) { if(buf[i] == d0 || buf[i] == d1 || buf[i] == d2 || buf[i] == d3) { return i; } }
+            return n;
+        }
+
         /**
          * Helper function to calculate the number of leaves in O(n), which can then be used to calculate the number of internal nodes in O(1)
          */
-        void calc_num_leaves() { for(const auto & curr_children : children) { if(curr_children.size() == 0) { num_leaves += 1; } } }
+        void calc_num_leaves() { CT_NODE_T num_nodes = get_num_nodes(); for(CT_NODE_T node = 0; node < num_nodes; ++node) { if(is_leaf(node)) { num_leaves += 1; } } }
 
     public:
         /**
@@ -99,7 +137,7 @@ class compact_tree {
          * Copy constructor
          * @param `o` The other `compact_tree` to copy
          */
-        compact_tree(const compact_tree & o) : parent(o.parent), children(o.children), label(o.label), length(o.length), num_leaves(o.num_leaves) {}
+        compact_tree(const compact_tree & o) : parent(o.parent), children(o.children), children_start(o.children_start), label(o.label), length(o.length), num_leaves(o.num_leaves) {}
 
         /**
          * Print the Newick string of the subtree rooted at a specific node
@@ -146,12 +184,45 @@ class compact_tree {
          */
         CT_NODE_T get_parent(CT_NODE_T node) const { return parent[node]; }
 
+        /**
+         * Read-only view of the children of a node (a contiguous slice of `children`, only valid while the tree exists).
+         * Supports the read-only `std::vector` interface (iteration, `size`, `empty`, `[]`, `at`, `front`, `back`), and converts implicitly to a `std::vector<CT_NODE_T>` copy for code that needs a real `vector`
+         */
+        class children_view {
+            private:
+                const CT_NODE_T* first; const CT_NODE_T* last;
+            public:
+                children_view(const CT_NODE_T* f, const CT_NODE_T* l) : first(f), last(l) {}
+                const CT_NODE_T* begin() const { return first; }
+                const CT_NODE_T* end() const { return last; }
+                size_t size() const { return last - first; }
+                bool empty() const { return first == last; }
+                const CT_NODE_T & operator[](size_t i) const { return first[i]; }
+                const CT_NODE_T & at(size_t i) const { if(i >= size()) { throw std::out_of_range(ERROR_CHILD_INDEX_OUT_OF_RANGE); } return first[i]; }
+                const CT_NODE_T & front() const { return *first; }
+                const CT_NODE_T & back() const { return *(last - 1); }
+                operator std::vector<CT_NODE_T>() const { return std::vector<CT_NODE_T>(first, last); }
+        };
+
         /**
          * Get the children of a node
          * @param node The node to get the children of
          * @return The children of `node`
          */
-        const std::vector<CT_NODE_T> & get_children(CT_NODE_T node) const { return children[node]; }
+        children_view get_children(CT_NODE_T node) const { return children_view(children.data() + children_start[node], children.data() + children_start[node+1]); }
+
+        /**
+         * Check if a node is a leaf
+         * @param node The node to check
+         * @return `true` if `node` is a leaf, otherwise `false`
+         */
+        bool is_leaf(CT_NODE_T node) const { return children_start[node] == children_start[node+1]; }
+
+        /**
+         * Get all parents (return by reference)
+         * @return A `vector<CT_NODE_T>` where the `i`-th value is the parent of node `i`
+         */
+        const std::vector<CT_NODE_T> & get_parents() const { return parent; }
 
         /**
          * Get the incident edge length of a node
@@ -169,6 +240,12 @@ class compact_tree {
             if(length.size() == 0) { length = std::vector<CT_LENGTH_T>(get_num_nodes(), (CT_LENGTH_T)0.); } length[node] = new_length;
         }
 
+        /**
+         * Get all incident edge lengths (return by reference)
+         * @return A `vector<CT_LENGTH_T>` where the `i`-th value is the incident edge length of node `i` (empty if edge lengths were not stored)
+         */
+        const std::vector<CT_LENGTH_T> & get_edge_lengths() const { return length; }
+
         /**
          * Get the label of a node
          * @param node The node to get the label of
@@ -236,14 +313,14 @@ class compact_tree {
             public:
                 leaves_iterator(CT_NODE_T x, const compact_tree* const tp) : node(x), tree_ptr(tp) {}
                 leaves_iterator(const leaves_iterator & it) : node(it.node), tree_ptr(it.tree_ptr) {}
-                leaves_iterator & operator++() { CT_NODE_T num_nodes = tree_ptr->get_num_nodes(); while(((++node) < num_nodes) && (tree_ptr->children[node].size() != 0)) {} return *this; }
+                leaves_iterator & operator++() { CT_NODE_T num_nodes = tree_ptr->get_num_nodes(); while(((++node) < num_nodes) && !(tree_ptr->is_leaf(node))) {} return *this; }
                 leaves_iterator operator++(int) { leaves_iterator tmp(*this); operator++(); return tmp; }
                 bool operator==(const leaves_iterator & rhs) const { return node == rhs.node; }
                 bool operator!=(const leaves_iterator & rhs) const { return node != rhs.node; }
                 CT_NODE_T operator*() { return node; }
         };
-        leaves_iterator leaves_begin() { CT_NODE_T node = (CT_NODE_T)0; CT_NODE_T num_nodes = get_num_nodes(); while(((++node) < num_nodes) && (children[node].size() != 0)) {} return leaves_iterator(node, this); }
-        leaves_iterator leaves_end() { return leaves_iterator((CT_NODE_T)get_num_nodes(), this); }
+        leaves_iterator leaves_begin() const { CT_NODE_T node = (CT_NODE_T)0; CT_NODE_T num_nodes = get_num_nodes(); while(((++node) < num_nodes) && !is_leaf(node)) {} return leaves_iterator(node, this); }
+        leaves_iterator leaves_end() const { return leaves_iterator((CT_NODE_T)get_num_nodes(), this); }
 
         /**
          * Find and return the Most Recent Common Ancestor (MRCA) of a collection of nodes
@@ -273,11 +350,12 @@ class compact_tree {
          * @return The total branch length of this tree
          */
         double calc_total_bl(bool include_internal = true, bool include_leaves = true) {
-            if(!(include_internal || include_leaves)) { return 0.; }
-            double tot = 0; CT_NODE_T num_nodes = get_num_nodes();
-            for(CT_NODE_T node = 0; node < num_nodes; ++node) {
-                if(children[node].size() == 0) { if(include_leaves) { tot += get_edge_length(node); } }
-                else { if(include_internal) { tot += get_edge_length(node); } }
+            if(!(include_internal || include_leaves) || (length.size() == 0)) { return 0.; }
+            double tot = 0; CT_NODE_T num_nodes = get_num_nodes(); CT_NODE_T node;
+            if(include_internal && include_leaves) {
+                for(node = 0; node < num_nodes; ++node) { tot += length[node]; }
+            } else {
+                for(node = 0; node < num_nodes; ++node) { if(is_leaf(node) == include_leaves) { tot += length[node]; } }
             }
             return tot;
         }
@@ -296,6 +374,37 @@ class compact_tree {
             return tot / den;
         }
 
+        /**
+         * Calculate the number of descendants (including the node itself) of every node in a single postorder pass
+         * @return A `vector<CT_NODE_T>` where the `i`-th value is the number of descendants of node `i`
+         */
+        std::vector<CT_NODE_T> calc_num_descendants() const {
+            std::vector<CT_NODE_T> num_descendants(get_num_nodes(), (CT_NODE_T)1);
+            for(CT_NODE_T node = get_num_nodes() - 1; node != 0; --node) { num_descendants[parent[node]] += num_descendants[node]; } // push each count up to the parent instead of pulling from the children
+            return num_descendants;
+        }
+
+        /**
+         * Calculate the (weighted) root distance of every node in a single preorder pass
+         * @return A `vector<double>` where the `i`-th value is the sum of the edge lengths on the path from the root to node `i`
+         */
+        std::vector<double> calc_root_dists() const {
+            CT_NODE_T num_nodes = get_num_nodes(); std::vector<double> root_dists(num_nodes, 0.);
+            if(length.size() == 0) { return root_dists; }
+            for(CT_NODE_T node = 1; node < num_nodes; ++node) { root_dists[node] = root_dists[parent[node]] + length[node]; }
+            return root_dists;
+        }
+
+        /**
+         * Calculate the depth (i.e., unweighted root distance) of every node in a single preorder pass
+         * @return A `vector<CT_NODE_T>` where the `i`-th value is the number of edges on the path from the root to node `i`
+         */
+        std::vector<CT_NODE_T> calc_depths() const {
+            CT_NODE_T num_nodes = get_num_nodes(); std::vector<CT_NODE_T> depths(num_nodes, (CT_NODE_T)0);
+            for(CT_NODE_T node = 1; node < num_nodes; ++node) { depths[node] = depths[parent[node]] + 1; }
+            return depths;
+        }
+
         /**
          * Calculate the (weighted) distance between two nodes
          * @param `u` The first node
@@ -303,21 +412,34 @@ class compact_tree {
          * @return The (weighted) distance between `u` and `v`
          */
         double calc_dist(CT_NODE_T u, CT_NODE_T v) {
-            if(u == v) { return 0.; } if(u == parent[v]) { return get_edge_length(v); } if(v == parent[u]) { return get_edge_length(u); }
-            std::unordered_map<CT_NODE_T, double> u_dists; std::unordered_map<CT_NODE_T, double> v_dists; CT_NODE_T c = u; CT_NODE_T p = parent[c]; std::unordered_map<CT_NODE_T, double>::iterator it;
-            while(p != NULL_NODE) { u_dists[p] = u_dists[c] + get_edge_length(c); c = p; p = parent[p]; } c = v; p = parent[c];
-            while(p != NULL_NODE) { v_dists[p] = v_dists[c] + get_edge_length(c); it = u_dists.find(p); if(it != u_dists.end()) { return it->second + v_dists[p]; } c = p; p = parent[p]; }
-            return -1.; // error, shouldn't reach here
+            // a node's index is always greater than its parent's, so the larger of `u` and `v` can't be their MRCA: step it up until they meet (no extra memory needed)
+            double dist = 0.;
+            while(u != v) { if(u > v) { dist += get_edge_length(u); u = parent[u]; } else { dist += get_edge_length(v); v = parent[v]; } }
+            return dist;
         }
+
+        /**
+         * Calculate the (weighted) distances between all pairs of leaves. Each pair is handled once at its MRCA in a single postorder pass, so this is O(n + L^2) time instead of calling `calc_dist` L^2 times. Note that this stores the full matrix, so it needs O(L^2) memory (8*L^2 bytes, e.g. ~80 GB for 100,000 leaves): for massive trees, call `calc_dist` on each pair instead
+         * @return A flattened L-by-L `vector<double>` (row-major), where the leaves are indexed in the order of the leaves iterator (i.e., the value at `i*L + j` is the distance between the `i`-th and `j`-th leaves)
+         */
+        std::vector<double> calc_pairwise_leaf_dists() const;
 };
 
-// print Newick string (currently recursive)
+// print Newick string (iterative, so deep trees can't overflow the call stack)
 void compact_tree::print_newick(std::ostream & out, CT_NODE_T node, bool print_semicolon) {
-    std::vector<CT_NODE_T> & curr_children = children[node]; size_t curr_num_children = curr_children.size();
-    for(size_t i = 0; i < curr_num_children; ++i) { out << ((i == 0) ? '(' : ','); print_newick(out, curr_children[i], false); }
-    if(curr_num_children != 0) { out << ')'; }
-    if(label.size() != 0) { out << label[node]; }
-    if(length.size() != 0) { out << ':' << length[node]; }
+    bool has_lengths = (length.size() != 0); bool has_labels = (label.size() != 0);
+    std::stack<std::pair<CT_NODE_T, size_t>> to_visit; to_visit.push(std::make_pair(node,0)); // first = node; second = index of next child to print
+    while(!to_visit.empty()) {
+        std::pair<CT_NODE_T, size_t> & curr = to_visit.top(); children_view curr_children = get_children(curr.first);
+        if(curr.second < curr_children.size()) { // print next child's subtree before finishing this node
+            out << ((curr.second == 0) ? '(' : ','); to_visit.push(std::make_pair(curr_children[curr.second++], 0));
+        } else {                                  // all children printed, so finish this node
+            if(curr_children.size() != 0) { out << ')'; }
+            if(has_labels) { out << label[curr.first]; }
+            if(has_lengths) { out << ':' << length[curr.first]; }
+            to_visit.pop();
+        }
+    }
     if(print_semicolon) { out << ';'; }
 }
 
@@ -341,37 +463,68 @@ CT_NODE_T compact_tree::find_mrca(const std::unordered_set<CT_NODE_T> & nodes) {
     return NULL_NODE; // shouldn't ever reach here
 }
 
+// calculate all pairwise leaf distances
+std::vector<double> compact_tree::calc_pairwise_leaf_dists() const {
+    std::vector<CT_NODE_T> leaves(leaves_begin(), leaves_end()); size_t num_leaves = leaves.size();
+    std::vector<double> dists(num_leaves * num_leaves, 0.); std::vector<double> root_dists = calc_root_dists();
+    std::vector<std::vector<size_t>> subtree_leaves(get_num_nodes()); // `subtree_leaves[i]` = indices (in `leaves`) of the leaves below node `i` (freed once merged into the parent)
+    for(size_t i = 0; i < num_leaves; ++i) { subtree_leaves[leaves[i]].emplace_back(i); }
+    for(CT_NODE_T node = get_num_nodes(); node-- != 0;) {
+        if(is_leaf(node)) { continue; }
+        std::vector<size_t> & curr_leaves = subtree_leaves[node]; double offset = 2 * root_dists[node];
+        for(const CT_NODE_T child : get_children(node)) {
+            std::vector<size_t> & child_leaves = subtree_leaves[child];
+            for(const size_t u : curr_leaves) {
+                for(const size_t v : child_leaves) {
+                    dists[u*num_leaves + v] = dists[v*num_leaves + u] = root_dists[leaves[u]] + root_dists[leaves[v]] - offset;
+                }
+            }
+            curr_leaves.insert(curr_leaves.end(), child_leaves.begin(), child_leaves.end()); std::vector<size_t>().swap(child_leaves);
+        }
+    }
+    return dists;
+}
+
 // helper function to create new node and add as child to parent
 CT_NODE_T compact_tree::create_child(const CT_NODE_T parent_node) {
-    tmp_node = parent.size();                        // `tmp_node` = new child node
-    parent.emplace_back(parent_node);                // `parent[tmp_node]` = parent of new node (which is `parent_node`)
-    children.emplace_back(std::vector<CT_NODE_T>()); // `children[tmp_node]` = children of new node (currently empty)
+    tmp_node = parent.size();                // `tmp_node` = new child node
+    parent.emplace_back(parent_node);        // `parent[tmp_node]` = parent of new node (which is `parent_node`)
     if(length.size() != 0) {
-        length.emplace_back((CT_LENGTH_T)0);         // `length[tmp_node]` = incident edge length of new node (currently 0)
+        length.emplace_back((CT_LENGTH_T)0); // `length[tmp_node]` = incident edge length of new node (currently 0)
     }
     if(label.size() != 0) {
-        label.emplace_back("");                      // `label[tmp_node]` = label of new node (currently nothing)
+        label.emplace_back("");              // `label[tmp_node]` = label of new node (currently nothing)
     }
-    children[parent_node].emplace_back(tmp_node);    // add `tmp_node` as a new child of `parent_node`
-    return tmp_node;
+    return tmp_node;                         // children of `parent_node` are filled in later by `build_children`
+}
+
+// helper function to build the CSR children arrays from the parent array (children are created in order, so node order preserves child order)
+void compact_tree::build_children() {
+    CT_NODE_T num_nodes = get_num_nodes(); CT_NODE_T node;
+    children_start.assign(num_nodes + 1, (CT_NODE_T)0); children.assign(num_nodes - 1, (CT_NODE_T)0);
+    for(node = 1; node < num_nodes; ++node) { ++children_start[parent[node] + 1]; }                  // count the children of each node
+    for(node = 0; node < num_nodes; ++node) { children_start[node + 1] += children_start[node]; }    // `children_start[i]` = start of node `i`
+    for(node = 1; node < num_nodes; ++node) { children[children_start[parent[node]]++] = node; }     // fill (shifts `children_start[i]` to end of node `i`)
+    for(node = num_nodes; node != 0; --node) { children_start[node] = children_start[node - 1]; } children_start[0] = 0; // shift back
 }
 
 // extract a subtree
 compact_tree compact_tree::extract_subtree(CT_NODE_T node) {
     compact_tree new_tree; std::stack<std::pair<CT_NODE_T, CT_NODE_T>> to_copy; to_copy.push(std::make_pair(node,0)); // first = old tree; second = new tree
     bool has_lengths = (length.size() != 0); bool has_labels = (label.size() != 0);
-    new_tree.parent.emplace_back(NULL_NODE); new_tree.children.emplace_back(std::vector<CT_NODE_T>());
+    new_tree.parent.emplace_back(NULL_NODE);
     if(has_lengths) { new_tree.length.emplace_back((CT_LENGTH_T)0.); }
     if(has_labels) { new_tree.label.emplace_back(""); }
     std::pair<CT_NODE_T, CT_NODE_T> curr; size_t tmp_num_children_old; size_t tmp_ind_old;
     while(!to_copy.empty()) {
-        curr = to_copy.top(); to_copy.pop(); std::vector<CT_NODE_T> & children_old = children[curr.first]; tmp_num_children_old = children_old.size();
+        curr = to_copy.top(); to_copy.pop(); children_view children_old = get_children(curr.first); tmp_num_children_old = children_old.size();
         if(has_lengths) { new_tree.length[curr.second] = length[curr.first]; }
         if(has_labels) { new_tree.label[curr.second] = label[curr.first]; }
         for(tmp_ind_old = 0; tmp_ind_old < tmp_num_children_old; ++tmp_ind_old) {
             to_copy.push(std::make_pair(children_old[tmp_ind_old], new_tree.create_child(curr.second)));
         }
     }
+    new_tree.build_children();
     return new_tree;
 }
 
@@ -380,19 +533,44 @@ compact_tree::compact_tree(char* input, bool is_fn, bool store_labels, bool stor
     // reserve space up-front (if given `reserve`) to reduce resizing (save time)
     if(reserve != 0) { parent.reserve(reserve); if(store_lengths) { length.reserve(reserve); } if(store_labels) { label.reserve(reserve); } }
 
-    // set up file input: https://stackoverflow.com/a/17925143/2134991
-    int fd = -1;
-    size_t bytes_read = 0; size_t i;              // variables to help with reading
-    char read_buf[IO_BUFFER_SIZE + 1];            // buffer for reading
+    // set up input: memory-map regular files (parsed in place, no copy into a user-space buffer), read everything else (pipes, FIFOs, etc.) into a buffer, or use the C string directly
+    size_t bytes_read = 0; size_t i; size_t j;    // variables to help with reading
     char str_buf[STR_BUFFER_SIZE] = {}; size_t str_buf_i = 0; // helper string buffer
-    char* buf;                                    // either read_buf (if reading from file) or the C string (if reading Newick string)
+    std::vector<char> read_buf;                   // buffer for reading (only used if the file can't be memory-mapped)
+    const char* buf;                              // either the memory-mapped file or `read_buf` (if reading from file) or the C string (if reading Newick string)
+    struct mmap_guard { void* addr = MAP_FAILED; size_t size = 0; ~mmap_guard() { if(addr != MAP_FAILED) { munmap(addr, size); } } } mapped; // unmap file however we leave
     if(is_fn) {
-        fd = open(input, O_RDONLY);
+        int fd = open(input, O_RDONLY);
         if(fd == -1) {
             throw std::invalid_argument(ERROR_OPENING_FILE + ": " + input);
         }
-        posix_fadvise(fd, 0, 0, 1);               // FDADVICE_SEQUENTIAL
-        buf = read_buf;
+        struct stat st;
+        if(fstat(fd, &st) == -1) {
+            close(fd); throw std::invalid_argument(ERROR_OPENING_FILE + ": " + input);
+        }
+        if(S_ISREG(st.st_mode) && st.st_size > 0) {
+            bytes_read = (size_t)st.st_size; mapped.addr = mmap(NULL, bytes_read, PROT_READ, MAP_PRIVATE, fd, 0); close(fd); // mapping stays valid after closing
+            if(mapped.addr == MAP_FAILED) {
+                throw std::invalid_argument(ERROR_OPENING_FILE + ": " + input);
+            }
+            mapped.size = bytes_read; madvise(mapped.addr, bytes_read, MADV_SEQUENTIAL);
+            buf = (const char*)mapped.addr;
+        } else {
+            ssize_t curr_read;
+            while(true) {
+                read_buf.resize(bytes_read + IO_BUFFER_SIZE); curr_read = read(fd, read_buf.data() + bytes_read, IO_BUFFER_SIZE);
+                if(curr_read == -1 && errno == EINTR) { continue; } // interrupted by a signal before reading anything, so just retry
+                if(curr_read <= 0) { break; } bytes_read += (size_t)curr_read;
+            }
+            close(fd);
+            if(curr_read == -1) {
+                throw std::invalid_argument(ERROR_OPENING_FILE + ": " + input);
+            }
+            buf = read_buf.data();
+        }
+        if(bytes_read == 0) {
+            throw std::invalid_argument(ERROR_INVALID_NEWICK_FILE + ": " + input);
+        }
     } else {
         bytes_read = strlen(input);
         buf = input;
@@ -400,7 +578,6 @@ compact_tree::compact_tree(char* input, bool is_fn, bool store_labels, bool stor
 
     // set up root node (initially empty/blank)
     parent.emplace_back(NULL_NODE);
-    children.emplace_back(std::vector<CT_NODE_T>());
     if(store_lengths) { length.emplace_back((CT_LENGTH_T)0); }
     if(store_labels) { label.emplace_back(""); }
 
@@ -412,138 +589,126 @@ compact_tree::compact_tree(char* input, bool is_fn, bool store_labels, bool stor
     bool parse_label_double = false; // parsing a double-quote label right now?
     bool parse_comment = false;      // parsing a comment [...] right now?
 
-    // read Newick tree byte-by-byte
-    while(true) {
-        // either read from file or from Newick C string
-        if(is_fn) {
-            bytes_read = read(fd, buf, IO_BUFFER_SIZE);
-        } else {
-            buf = input;
+    // parse Newick tree in a single pass over the input
+    for(i = 0; i < bytes_read; ++i) {
+        // currently parsing a comment (ignore for now)
+        if(parse_comment) {
+            // skip to end of comment (or end of input if the comment is never closed)
+            const char* end_ptr = (const char*)std::memchr(buf + i, ']', bytes_read - i);
+            if(end_ptr == NULL) {
+                i = bytes_read - 1;
+            } else {
+                i = end_ptr - buf; parse_comment = false;
+            }
         }
 
-        // handle done reading (!bytes_read) and read failed (bytes_read == -1)
-        if(!bytes_read || bytes_read == (size_t)(-1)) {
-            throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
+        // currently parsing an edge length
+        else if(parse_length) {
+            // copy all characters up to the next delimiter (or end of input) into the edge length
+            j = find_delim(buf, i, bytes_read, ',', ')', ';', '[');
+            if(store_lengths) { std::memcpy(str_buf + str_buf_i, buf + i, j - i); str_buf_i += (j - i); }
+            if(j == bytes_read) { i = j - 1; continue; }
+            i = j;
+
+            // edge comment (ignore for now)
+            if(buf[i] == '[') {
+                parse_comment = true;
+            }
+
+            // finished parsing edge length
+            else {
+                if(store_lengths) { str_buf[str_buf_i] = (char)0; length[curr_node] = PARSE_LENGTH_FROM_C_STR(str_buf); }
+                parse_length = false; --i; // need to re-read this character
+            }
         }
 
-        // iterate over the characters in the buffer
-        for(i = 0; i < bytes_read; ++i) {
-            // currently parsing a comment (ignore for now)
-            if(parse_comment) {
-                // reached end of comment
-                if(buf[i] == ']') {
-                    parse_comment = false;
+        // currently parsing a node label
+        else if(parse_label) {
+            // parsing quoted label ('' or ""), so blindly add next char to label
+            if(parse_label_single || parse_label_double) {
+                if(store_labels) { str_buf[str_buf_i++] = buf[i]; }
+                if(buf[i] == '\'' && parse_label_single) {
+                    parse_label = false; parse_label_single = false;
+                } else if(buf[i] == '"' && parse_label_double) {
+                    parse_label = false; parse_label_double = false;
                 }
             }
 
-            // currently parsing an edge length
-            else if(parse_length) {
-                switch(buf[i]) {
-                    // finished parsing edge length
-                    case ',':
-                    case ')':
-                    case ';':
-                        if(store_lengths) { str_buf[str_buf_i] = (char)0; length[curr_node] = PARSE_LENGTH_FROM_C_STR(str_buf); }
-                        parse_length = false; --i; break; // need to re-read this character
-
-                    // edge comment (ignore for now)
-                    case '[':
-                        parse_comment = true; break;
-
-                    // character within edge length
-                    default:
-                        if(store_lengths) { str_buf[str_buf_i++] = buf[i]; }
-                        break;
-                }
+            // parsing non-quoted label, so copy all characters up to the next delimiter (or end of input) into the label
+            else {
+                j = find_delim(buf, i, bytes_read, ':', ',', ')', ';');
+                if(store_labels) { std::memcpy(str_buf + str_buf_i, buf + i, j - i); str_buf_i += (j - i); }
+                if(j == bytes_read) { i = j - 1; continue; }
+                parse_label = false; i = j - 1; // finished label, so need to re-read this character
             }
 
-            // currently parsing a node label
-            else if(parse_label) {
-                // parsing quoted label ('' or ""), so blindly add next char to label
-                if(parse_label_single || parse_label_double) {
-                    if(store_labels) { str_buf[str_buf_i++] = buf[i]; }
-                    if(buf[i] == '\'' && parse_label_single) {
-                        parse_label = false; parse_label_single = false;
-                    } else if(buf[i] == '"' && parse_label_double) {
-                        parse_label = false; parse_label_double = false;
+            // if we finished parsing the label, finalize it
+            if(!parse_label) {
+                if(store_labels) { str_buf[str_buf_i] = (char)0; label[curr_node] = str_buf; }
+                parse_label = false;
+            }
+        }
+
+        // all other symbols
+        else {
+            switch(buf[i]) {
+                // ignore spaces outside of labels
+                case ' ':
+                    break;
+
+                // end of Newick string
+                case ';':
+                    if(curr_node != (CT_NODE_T)0) {
+                        throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
                     }
-                }
+                    build_children(); return;
 
-                // parsing non-quoted label, so check next char for validity before adding
-                else {
-                    switch(buf[i]) {
-                        case ':': case ',': case ')': case ';':
-                            parse_label = false; --i; break; // finished label, so need to re-read this character
-                        default:
-                            if(store_labels) { str_buf[str_buf_i++] = buf[i]; } break;
+                // go to new child
+                case '(':
+                    if(curr_node == NULL_NODE) {
+                        throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
                     }
-                }
+                    curr_node = create_child(curr_node); break;
 
-                // if we finished parsing the label, finalize it
-                if(!parse_label) {
-                    if(store_labels) { str_buf[str_buf_i] = (char)0; label[curr_node] = str_buf; }
-                    parse_label = false;
-                }
-            }
+                // go to parent
+                case ')':
+                    curr_node = parent[curr_node]; break;
 
-            // all other symbols
-            else {
-                switch(buf[i]) {
-                    // ignore spaces outside of labels
-                    case ' ':
-                        break;
-
-                    // end of Newick string
-                    case ';':
-                        if(curr_node != (CT_NODE_T)0) {
-                            throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
-                        }
-                        return;
-
-                    // go to new child
-                    case '(':
-                        if(curr_node == NULL_NODE) {
-                            throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
-                        }
-                        curr_node = create_child(curr_node); break;
-
-                    // go to parent
-                    case ')':
-                        curr_node = parent[curr_node]; break;
-
-                    // go to new sibling
-                    case ',':
-                        if((curr_node == NULL_NODE) || (parent[curr_node] == NULL_NODE)) {
-                            throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
-                        }
-                        curr_node = create_child(parent[curr_node]); break;
-
-                    // node comment (ignore for now)
-                    case '[':
-                        parse_comment = true; break;
-
-                    // edge length
-                    case ':':
-                        if(store_lengths) { str_buf_i = 0; }
-                        parse_length = true; break;
-
-                    // about to parse a node label in single quotes ('')
-                    case '\'':
-                        if(store_labels) { str_buf_i = 0; }
-                        parse_label = true; parse_label_single = true; break;
-
-                    // about to parse a node label in double quotes ("")
-                    case '"':
-                        if(store_labels) { str_buf_i = 0; }
-                        parse_label = true; parse_label_double = true; break;
-
-                    // about to start a node label without quotes
-                    default:
-                        if(store_labels) { str_buf_i = 0; }
-                        parse_label = true; --i; break; // need to re-read this character (it's part of the label)
-                }
+                // go to new sibling
+                case ',':
+                    if((curr_node == NULL_NODE) || (parent[curr_node] == NULL_NODE)) {
+                        throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
+                    }
+                    curr_node = create_child(parent[curr_node]); break;
+
+                // node comment (ignore for now)
+                case '[':
+                    parse_comment = true; break;
+
+                // edge length
+                case ':':
+                    if(store_lengths) { str_buf_i = 0; }
+                    parse_length = true; break;
+
+                // about to parse a node label in single quotes ('')
+                case '\'':
+                    if(store_labels) { str_buf_i = 0; }
+                    parse_label = true; parse_label_single = true; break;
+
+                // about to parse a node label in double quotes ("")
+                case '"':
+                    if(store_labels) { str_buf_i = 0; }
+                    parse_label = true; parse_label_double = true; break;
+
+                // about to start a node label without quotes
+                default:
+                    if(store_labels) { str_buf_i = 0; }
+                    parse_label = true; --i; break; // need to re-read this character (it's part of the label)
             }
         }
     }
+
+    // reached end of input without finding the end of the Newick string
+    throw std::invalid_argument((is_fn ? ERROR_INVALID_NEWICK_FILE : ERROR_INVALID_NEWICK_STRING) + ": " + input);
 }
 #endif
@@ -14,12 +14,12 @@ int main(int argc, char** argv) {
     compact_tree tree(argv[1]);
 
     // find and print all pairwise leaf distances
-    std::vector<CT_NODE_T> leaves(tree.leaves_begin(), tree.leaves_end()); size_t num_leaves = leaves.size();
+    std::vector<CT_NODE_T> leaves(tree.leaves_begin(), tree.leaves_end()); size_t num_leaves = leaves.size(); const std::vector<std::string> & labels = tree.get_labels();
     for(size_t i = 0; i < num_leaves-1; ++i) {
-        CT_NODE_T u = leaves[i]; const std::string & ul = tree.get_label(u);
+        CT_NODE_T u = leaves[i]; const std::string & ul = labels[u];
         for(size_t j = i+1; j < num_leaves; ++j) {
-            CT_NODE_T v = leaves[j]; const std::string & vl = tree.get_label(v);
-            std::cout << ul << ", " << vl << ": " << tree.calc_dist(u,v) << std::endl;
+            CT_NODE_T v = leaves[j]; const std::string & vl = labels[v];
+            std::cout << ul << ", " << vl << ": " << tree.calc_dist(u,v) << '\n';
         }
     }
     return 0;
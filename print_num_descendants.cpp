@@ -2,6 +2,7 @@
  * Print the number of descendants (including the node itself) of all labeled nodes in the tree to showcase postorder traversal
  */
 #include <iostream>
+#include <string>
 #include <vector>
 #include "compact_tree.h"
 int main(int argc, char** argv) {
@@ -12,18 +13,15 @@ int main(int argc, char** argv) {
     compact_tree tree(argv[1], true, true, false);
 
     // calculate and print number of descendants
-    std::vector<unsigned int> num_descendants(tree.get_num_nodes(), 1);
+    std::vector<CT_NODE_T> num_descendants(tree.get_num_nodes(), 1); const std::vector<std::string> & labels = tree.get_labels();
     compact_tree::postorder_iterator it_end = tree.postorder_end();
     CT_NODE_T curr_node;
     for(compact_tree::postorder_iterator it = tree.postorder_begin(); it != it_end; ++it) {
         curr_node = *it;
-        const std::vector<CT_NODE_T> & curr_children = tree.get_children(curr_node);
-        if(curr_children.size() != 0) {
-            for(auto child_node : curr_children) {
-                num_descendants[curr_node] += num_descendants[child_node];
-            }
+        for(auto child_node : tree.get_children(curr_node)) {
+            num_descendants[curr_node] += num_descendants[child_node];
         }
-        std::cout << tree.get_label(curr_node) << ": " << num_descendants[curr_node] << std::endl;
+        std::cout << labels[curr_node] << ": " << num_descendants[curr_node] << '\n';
     }
     return 0;
 }
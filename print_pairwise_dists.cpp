@@ -0,0 +1,31 @@
+/**
+ * Print the pairwise distance matrix of the leaves in the tree (tab-separated) to showcase all-pairs leaf distance calculation
+ * Note: the full matrix is stored in memory (8*L^2 bytes for L leaves); for massive trees, see print_distances.cpp instead
+ */
+#include <iostream>
+#include <string>
+#include <vector>
+#include "compact_tree.h"
+int main(int argc, char** argv) {
+    // check user args
+    if(argc != 2) {
+        std::cerr << "USAGE: " << argv[0] << " <tree_file>" << std::endl; exit(1);
+    }
+    const compact_tree tree(argv[1]);
+
+    // calculate and print the pairwise leaf distance matrix
+    std::vector<CT_NODE_T> leaves(tree.leaves_begin(), tree.leaves_end()); size_t num_leaves = leaves.size(); const std::vector<std::string> & labels = tree.get_labels();
+    std::vector<double> dists = tree.calc_pairwise_leaf_dists();
+    for(size_t j = 0; j < num_leaves; ++j) {
+        std::cout << '\t' << labels[leaves[j]];
+    }
+    std::cout << '\n';
+    for(size_t i = 0; i < num_leaves; ++i) {
+        std::cout << labels[leaves[i]];
+        for(size_t j = 0; j < num_leaves; ++j) {
+            std::cout << '\t' << dists[i*num_leaves + j];
+        }
+        std::cout << '\n';
+    }
+    return 0;
+}
@@ -1,7 +1,8 @@
 /**
- * Print root distances of all labeled nodes in the tree to showcase preorder traversal
+ * Print root distances of all labeled nodes in the tree to showcase bulk root distance calculation (`calc_root_dists`) and preorder traversal
  */
 #include <iostream>
+#include <string>
 #include <vector>
 #include "compact_tree.h"
 int main(int argc, char** argv) {
@@ -12,17 +13,13 @@ int main(int argc, char** argv) {
     compact_tree tree(argv[1]);
 
     // calculate and print root distances
-    std::vector<CT_LENGTH_T> root_dists(tree.get_num_nodes(), (CT_LENGTH_T)0);
+    std::vector<double> root_dists = tree.calc_root_dists(); const std::vector<std::string> & labels = tree.get_labels();
     compact_tree::preorder_iterator it_end = tree.preorder_end();
-    CT_NODE_T curr_node; CT_NODE_T root = tree.get_root();
-    const std::string* curr_label_ptr;
+    CT_NODE_T curr_node;
     for(compact_tree::preorder_iterator it = tree.preorder_begin(); it != it_end; ++it) {
-        curr_node = *it; curr_label_ptr = &tree.get_label(curr_node);
-        if(curr_node != root) {
-            root_dists[curr_node] = root_dists[tree.get_parent(curr_node)] + tree.get_edge_length(curr_node);
-        }
-        if((*curr_label_ptr).size() != 0) {
-            std::cout << (*curr_label_ptr) << ": " << root_dists[curr_node] << std::endl;
+        curr_node = *it;
+        if(labels[curr_node].size() != 0) {
+            std::cout << labels[curr_node] << ": " << root_dists[curr_node] << '\n';
         }
     }
     return 0;